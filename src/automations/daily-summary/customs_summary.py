@@ -1,11 +1,19 @@
 import os
+import asyncio
+import enum
+import functools
+import hashlib
 import logging
-import json
-from datetime import datetime
-from typing import Dict, List, Optional
-import requests
-from dotenv import load_dotenv
+import math
+import random
+import re
 import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+import orjson
 
 # Configurar logging
 logging.basicConfig(
@@ -14,8 +22,167 @@ logging.basicConfig(
 )
 logger = logging.getLogger('CustomsSummary')
 
+@functools.lru_cache(maxsize=1)
+def get_whatsapp_config() -> Dict:
+    """Lê uma única vez as configurações do WhatsApp das variáveis de ambiente."""
+    return {
+        'api_url': os.getenv('WAPI_URL'),
+        'token': os.getenv('WAPI_TOKEN'),
+        'connection_key': os.getenv('WAPI_CONNECTION_KEY'),
+        'whatsapp_number': os.getenv('TECHNICAL_DEPT_NUMBER')
+    }
+
+# Status HTTP considerados transitórios, que justificam uma nova tentativa
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Traduções dos eventos do 17track exibidos no resumo
+TRANSLATIONS = {
+    'Import customs clearance delay': 'Atraso no desembaraço aduaneiro',
+    'Customs duties payment requested': 'Pagamento de taxas alfandegárias solicitado',
+    'Package returning to sender': 'Pacote retornando ao remetente',
+    'Carrier note': 'Nota da transportadora',
+    'Awaiting payment': 'Aguardando pagamento',
+    'Devolução determinada pela autoridade competente': 'Devolução determinada pela autoridade competente',
+    'Import customs retained': 'Retido na alfândega',
+    'Import customs clearance complete': 'Desembaraço aduaneiro concluído',
+    'Pending customs inspection': 'Aguardando inspeção aduaneira',
+    'Customs charges due': 'Taxas alfandegárias pendentes'
+}
+
+# Frases mais longas primeiro, para que a alternação prefira a correspondência mais longa
+TRANSLATIONS_RE = re.compile('|'.join(
+    re.escape(phrase) for phrase in sorted(TRANSLATIONS, key=len, reverse=True)
+))
+
+class PkgClassification(enum.Enum):
+    """Seção do resumo em que um pacote com pendência é listado."""
+    TAXA_PENDENTE = 'taxa_pendente'
+    EM_ALERTA = 'em_alerta'
+    COM_PROBLEMAS = 'com_problemas'
+    RETORNANDO = 'retornando'
+    OUTROS = 'outros'  # Pendente, mas sem seção no resumo
+
+@dataclass(slots=True)
+class PkgView:
+    """Campos de um pacote do 17track usados no resumo, extraídos uma única vez."""
+    number: str
+    status: str
+    event_raw: str
+    event: str = ''  # Evento traduzido, preenchido em check_taxation
+    classification: Optional[PkgClassification] = None
+    
+    @classmethod
+    def from_package(cls, package: Dict) -> Optional['PkgView']:
+        """Monta a visão a partir da resposta do gettrackinfo; None se não houver track_info."""
+        try:
+            track_info = package.get('track_info') if package else None
+            if not track_info:
+                logger.debug('Pacote inválido ou sem track_info')
+                return None
+            
+            latest_event = track_info.get('latest_event', {}) or {}
+            latest_status = track_info.get('latest_status', {}) or {}
+            event_raw = latest_event.get('description') or ''
+            
+            return cls(
+                number=package.get('number', 'N/A'),
+                status=(latest_status.get('status') or '').lower(),
+                event_raw=event_raw
+            )
+        except Exception as e:
+            # Um registro malformado não deve interromper o resumo dos demais
+            number = package.get('number', 'N/A') if isinstance(package, dict) else 'N/A'
+            logger.error('Erro ao verificar status do pacote %s: %s', number, e)
+            return None
+
+class ConcurrencyController:
+    """
+    Limite de concorrência adaptativo (AIMD) para as chamadas a uma API.
+    
+    Aumenta o limite aos poucos enquanto a latência está saudável e o reduz pela
+    metade quando a latência passa do alvo, em 429/5xx ou em falhas de conexão.
+    A redução acontece uma vez por evento de congestionamento: respostas de
+    requisições iniciadas antes da última redução não reduzem o limite de novo.
+    Respeita Retry-After e pausa novos envios quando a cota informada pela API
+    (x-ratelimit-remaining / x-ratelimit-limit) fica abaixo de 10%.
+    """
+    
+    def __init__(self, initial: float = 8, minimum: float = 1, maximum: float = 32,
+                 target_latency: float = 2.0, quota_pause: float = 1.0, max_pause: float = 30.0):
+        self.limit = min(initial, maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.quota_pause = quota_pause
+        self.max_pause = max_pause
+        self.avg_latency: Optional[float] = None
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+    
+    async def __aenter__(self) -> 'ConcurrencyController':
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+    
+    def decrease(self, started: Optional[float] = None) -> None:
+        """
+        Reduz o limite pela metade (multiplicative decrease).
+        
+        Args:
+            started: Instante (time.monotonic) em que a requisição que sinalizou o
+                congestionamento começou; se for anterior à última redução, ignora.
+        """
+        if started is not None and started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * 0.5)
+        self._last_decrease = time.monotonic()
+    
+    def pause(self, seconds: float) -> None:
+        """Suspende novas requisições por alguns segundos (no máximo max_pause)."""
+        seconds = min(seconds, self.max_pause)
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    def record(self, started: float, status: int, headers) -> None:
+        """Ajusta o limite a partir da latência, do status e dos headers de uma resposta iniciada em `started`."""
+        latency = time.monotonic() - started
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+        
+        if status in RETRY_STATUSES or self.avg_latency > self.target_latency:
+            self.decrease(started)
+        else:
+            self.limit = min(self.maximum, self.limit + 0.5)
+        
+        try:
+            retry_after = float(headers.get('Retry-After', 0))
+        except ValueError:
+            retry_after = 0
+        if retry_after > 0:
+            self.pause(retry_after)
+        
+        try:
+            remaining = int(headers['x-ratelimit-remaining'])
+            quota = int(headers['x-ratelimit-limit'])
+        except (KeyError, ValueError):
+            return
+        if quota > 0 and remaining < quota * 0.1:
+            self.pause(self.quota_pause)
+
 class CustomsSummary:
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, session: Optional[aiohttp.ClientSession] = None):
         """
         Inicializa o CustomsSummary.
         
@@ -23,12 +190,58 @@ class CustomsSummary:
             config: Dicionário com as configurações:
                 - endpoint: URL base da API 17track
                 - api_key: Chave da API 17track
+                - cache_enabled (opcional): habilita o cache das respostas do 17track
+                  no Redis ('1', 'true' ou 'yes'); desabilitado por padrão
+                - redis_host, redis_port, redis_password (opcionais): Redis usado
+                  pelo cache, quando habilitado
+                - list_cache_ttl, detail_cache_ttl (opcionais): TTL em segundos do
+                  cache da lista (padrão 3600) e dos detalhes (padrão 1800)
+            session: Sessão HTTP compartilhada (opcional). Quando informada, não é
+                fechada por close(); quem a criou é responsável por fechá-la.
         """
         self.validate_config(config)
         self.endpoint = config['endpoint'].rstrip('/')
         self.api_key = config['api_key']
+        
+        # URLs e headers da API do 17track, fixos durante a vida da instância
+        self.list_url = f"{self.endpoint}/track/v2.2/gettracklist"
+        self.track_url = f"{self.endpoint}/track/v2.2/gettrackinfo"
+        self.headers = {
+            '17token': self.api_key,
+            'Content-Type': 'application/json'
+        }
+        
         self.max_retries = 3
         self.retry_delay = 1
+        # Maior espera aceita do Retry-After; acima disso a tentativa falha em vez de travar a execução
+        self.max_retry_after = 30
+        # Limita o tempo de cada tentativa; conexões travadas viram retry em vez de bloquear a execução
+        self.timeout = aiohttp.ClientTimeout(total=15, sock_connect=3)
+        self.page_size = 200
+        # Tamanho de página que o 17track aplica quando limita o page_size pedido
+        self.min_page_size = 40
+        self.page_window = 8
+        
+        # Cache das respostas do 17track no Redis (opcional, só com habilitação explícita:
+        # o REDIS_HOST do ambiente é o Redis de produção do bot)
+        self.cache_enabled = str(config.get('cache_enabled') or '').lower() in ('1', 'true', 'yes')
+        self.redis_config = {
+            'host': config.get('redis_host'),
+            'port': int(config.get('redis_port') or 6379),
+            'password': config.get('redis_password') or None,
+            # Um Redis inacessível vira erro (e cai no fallback sem cache) em vez de travar a execução
+            'socket_connect_timeout': 3,
+            'socket_timeout': 3
+        }
+        self.list_cache_ttl = int(config.get('list_cache_ttl') or 3600)
+        self.detail_cache_ttl = int(config.get('detail_cache_ttl') or 1800)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._redis = None
+        
+        self._session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = session is None
+        self._controllers: Dict[str, ConcurrencyController] = {}
         
         # Palavras-chave para identificar problemas alfandegários
         self.customs_keywords = [
@@ -40,6 +253,11 @@ class CustomsSummary:
             'fiscalização',
             'autoridade competente'
         ]
+        self._customs_keywords_lc = tuple(k.lower() for k in self.customs_keywords)
+        self._customs_re = re.compile('|'.join(re.escape(k) for k in self._customs_keywords_lc))
+        
+        # Status do 17track que indicam problema com o pacote
+        self.problem_statuses = frozenset(['alert', 'expired', 'undelivered'])
         
         logger.info('CustomsSummary inicializado com sucesso')
     
@@ -50,190 +268,344 @@ class CustomsSummary:
         if missing:
             raise ValueError(f'Configurações faltando: {", ".join(missing)}')
     
-    def make_request(self, method: str, url: str, **kwargs) -> Dict:
-        """Faz uma requisição HTTP com retry."""
-        last_error = None
+    def get_session(self) -> aiohttp.ClientSession:
+        """Retorna a sessão HTTP compartilhada, criando-a na primeira chamada."""
+        if self._session is None or self._session.closed:
+            self._owns_session = True
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=30, ttl_dns_cache=300)
+            )
+        return self._session
+    
+    def get_redis(self):
+        """Retorna o cliente Redis do cache de respostas, ou None se o cache não estiver habilitado."""
+        if self._redis is None and self.cache_enabled and self.redis_config['host']:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.Redis(**self.redis_config)
+        return self._redis
+    
+    async def close(self) -> None:
+        """Fecha a sessão HTTP própria e a conexão com o Redis, se estiverem abertas."""
+        if self._owns_session and self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+    
+    def get_controller(self, url: str) -> ConcurrencyController:
+        """Retorna o controlador de concorrência do host da URL (um por API)."""
+        host = urlsplit(url).netloc
+        if host not in self._controllers:
+            # Acima do limite do pool, a latência medida incluiria a espera por uma conexão livre
+            pool_limit = self.get_session().connector.limit
+            maximum = min(32, pool_limit) if pool_limit else 32
+            self._controllers[host] = ConcurrencyController(maximum=maximum)
+        return self._controllers[host]
+    
+    def get_backoff(self, attempt: int) -> float:
+        """Espera exponencial com jitter antes da tentativa seguinte a `attempt`."""
+        return self.retry_delay * 2 ** attempt + random.random() * 0.1
+    
+    def get_retry_delay(self, response: aiohttp.ClientResponse, attempt: int) -> float:
+        """Retorna a espera antes da próxima tentativa, respeitando o header Retry-After."""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            return self.get_backoff(attempt)
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            return self.get_backoff(attempt)
+    
+    async def make_request(self, method: str, url: str, max_retries: Optional[int] = None, **kwargs) -> Dict:
+        """
+        Faz uma requisição HTTP com retry.
         
-        for attempt in range(self.max_retries):
+        Só são repetidas falhas transitórias: erros de conexão/timeout e respostas
+        com status em RETRY_STATUSES.
+        """
+        session = self.get_session()
+        controller = self.get_controller(url)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        
+        # Serializa o corpo JSON uma única vez com orjson (reaproveitado nas tentativas)
+        if 'json' in kwargs:
+            kwargs['data'] = orjson.dumps(kwargs.pop('json'))
+            kwargs['headers'] = {'Content-Type': 'application/json', **(kwargs.get('headers') or {})}
+        kwargs.setdefault('timeout', self.timeout)
+        
+        for attempt in range(max_retries):
+            is_last_attempt = attempt == max_retries - 1
+            started = time.monotonic()
             try:
-                response = requests.request(method, url, **kwargs)
-                
-                # Se a resposta for JSON, retorna o conteúdo
-                if 'application/json' in response.headers.get('content-type', ''):
-                    data = response.json()
-                    if data.get('error'):
-                        raise ValueError(f"Erro na API: {data.get('message')}")
-                    return data
+                async with controller:
+                    started = time.monotonic()
+                    async with session.request(method, url, **kwargs) as response:
+                        controller.record(started, response.status, response.headers)
+                        
+                        # Falha transitória do servidor: tenta novamente após liberar a vaga
+                        if response.status in RETRY_STATUSES and not is_last_attempt:
+                            delay = self.get_retry_delay(response, attempt)
+                            if delay > self.max_retry_after:
+                                logger.error('Servidor pediu espera de %.0fs (máximo %ss); desistindo.', delay, self.max_retry_after)
+                                response.raise_for_status()
+                            logger.warning('Tentativa %s falhou: status %s. Tentando novamente em %.1fs...', attempt + 1, response.status, delay)
+                        
+                        # Se a resposta for JSON, retorna o conteúdo
+                        elif 'application/json' in response.headers.get('content-type', ''):
+                            data = orjson.loads(await response.read())
+                            if data.get('error'):
+                                raise ValueError(f"Erro na API: {data.get('message')}")
+                            return data
+                        
+                        # Se não for JSON, verifica se houve erro
+                        else:
+                            response.raise_for_status()
+                            return await response.text()
                 
-                # Se não for JSON, verifica se houve erro
-                response.raise_for_status()
-                return response.text
-                
-            except Exception as e:
-                last_error = e
-                if attempt < self.max_retries - 1:
-                    logger.warning(f'Tentativa {attempt + 1} falhou: {str(e)}. Tentando novamente...')
-                    time.sleep(self.retry_delay)
-                else:
-                    logger.error(f'Erro na requisição após {self.max_retries} tentativas: {str(e)}')
+                await asyncio.sleep(delay)
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not isinstance(e, aiohttp.ClientResponseError):
+                    controller.decrease(started)
+                if is_last_attempt or isinstance(e, aiohttp.ClientResponseError):
+                    logger.error('Erro na requisição após %s tentativas: %s', attempt + 1, str(e) or type(e).__name__)
                     raise
+                logger.warning('Tentativa %s falhou: %s. Tentando novamente...', attempt + 1, str(e) or type(e).__name__)
+                await asyncio.sleep(self.get_backoff(attempt))
     
-    async def get_packages_with_pending_customs(self) -> List[Dict]:
+    async def make_cached_request(self, url: str, payload, headers: Dict, ttl: int) -> Dict:
+        """
+        POST para o 17track com cache da resposta no Redis.
+        
+        A chave é o hash de (url, payload); só respostas com code == 0 são
+        guardadas. Sem Redis configurado, equivale a make_request.
+        """
+        redis_client = self.get_redis()
+        if redis_client is None:
+            return await self.make_request('POST', url, json=payload, headers=headers)
+        
+        digest = hashlib.blake2b(
+            orjson.dumps([url, payload], option=orjson.OPT_SORT_KEYS), digest_size=16
+        ).hexdigest()
+        key = f'customs_summary:response:{digest}'
+        
+        try:
+            cached = await redis_client.get(key)
+        except Exception as e:
+            logger.warning('Erro ao ler cache do Redis: %s', e)
+            cached = None
+        
+        if cached is not None:
+            self.cache_hits += 1
+            return orjson.loads(cached)
+        
+        self.cache_misses += 1
+        response = await self.make_request('POST', url, json=payload, headers=headers)
+        
+        if response.get('code') == 0:
+            try:
+                await redis_client.setex(key, ttl, orjson.dumps(response))
+            except Exception as e:
+                logger.warning('Erro ao gravar cache no Redis: %s', e)
+        
+        return response
+    
+    async def get_packages_with_pending_customs(self) -> List[PkgView]:
         """Busca pacotes com pendências alfandegárias."""
         try:
             logger.info('🔍 Buscando pacotes no 17track...')
             
-            # Headers para a API do 17track
-            headers = {
-                '17token': self.api_key,
-                'Content-Type': 'application/json'
-            }
-            
-            # URLs da API
-            list_url = f"{self.endpoint}/track/v2.2/gettracklist"
-            track_url = f"{self.endpoint}/track/v2.2/gettrackinfo"
-            
             # Busca todos os pacotes
-            packages = await self.get_all_packages(list_url, headers)
-            logger.info(f'📦 Total de pacotes encontrados: {len(packages)}')
+            packages = await self.get_all_packages(self.list_url, self.headers)
             
-            # Busca detalhes dos pacotes
-            logger.info('🔍 Buscando detalhes dos pacotes...')
-            detailed_packages = await self.get_detailed_packages(packages, track_url, headers)
-            
-            # Filtra pacotes com pendências
+            # Busca detalhes dos pacotes, normalizando e filtrando os com pendências à medida que cada lote chega
             pending_packages = [
-                pkg for pkg in detailed_packages 
-                if self.check_taxation(pkg)
+                view async for pkg in self.iter_detailed_packages(packages, self.track_url, self.headers)
+                if (view := PkgView.from_package(pkg)) is not None and self.check_taxation(view)
             ]
             
-            logger.info(f'🚨 Pacotes com pendências encontrados: {len(pending_packages)}')
+            logger.info('🚨 Pacotes com pendências encontrados: %s', len(pending_packages))
             return pending_packages
             
         except Exception as e:
             logger.error('Erro ao buscar pacotes:', exc_info=True)
             raise
     
+    async def fetch_page(self, url: str, headers: Dict, page_no: int) -> Dict:
+        """Busca uma página da lista de pacotes."""
+        logger.debug('📄 Buscando página %s...', page_no)
+        
+        data = {
+            "tracking_status": "Tracking",
+            "page_no": page_no,
+            "page_size": self.page_size,
+            "order_by": "RegisterTimeDesc"
+        }
+        
+        response = await self.make_cached_request(url, data, headers, self.list_cache_ttl)
+        
+        if response.get('code') != 0:
+            raise ValueError(f'Erro ao buscar lista: {response.get("message")}')
+        
+        packages = response.get('data', {}).get('accepted', [])
+        logger.debug('✅ Encontrados %s pacotes na página %s', len(packages), page_no)
+        return response
+    
+    async def fetch_pages(self, url: str, headers: Dict, page_numbers: Iterable[int]) -> List[Dict]:
+        """Busca várias páginas em paralelo, na ordem pedida (a concorrência é limitada em make_request)."""
+        return await asyncio.gather(*[
+            self.fetch_page(url, headers, page_no) for page_no in page_numbers
+        ])
+    
     async def get_all_packages(self, url: str, headers: Dict) -> List[Dict]:
         """Busca todos os pacotes paginados."""
-        all_packages = []
-        current_page = 1
+        response = await self.fetch_page(url, headers, 1)
+        packages = response.get('data', {}).get('accepted', [])
+        all_packages = list(packages)
         
-        while True:
-            logger.info(f'📄 Buscando página {current_page}...')
-            
-            data = {
-                "tracking_status": "Tracking",
-                "page_no": current_page,
-                "order_by": "RegisterTimeDesc"
-            }
-            
-            response = self.make_request('POST', url, json=data, headers=headers)
-            
-            if response.get('code') != 0:
-                raise ValueError(f'Erro ao buscar lista: {response.get("message")}')
-            
-            packages = response.get('data', {}).get('accepted', [])
-            logger.info(f'✅ Encontrados {len(packages)} pacotes na página {current_page}')
-            
-            all_packages.extend(packages)
-            
-            # Verifica se há mais páginas
-            if len(packages) < 40:
-                break
-                
-            current_page += 1
+        # A primeira página informa o total de páginas (ou de pacotes); as demais são buscadas em paralelo
+        page_info = response.get('page') or {}
+        logger.debug('📄 Paginação informada pelo 17track: %s', page_info)
+        total_pages = page_info.get('page_total')
+        if not total_pages and page_info.get('data_total') and page_info.get('page_size'):
+            total_pages = math.ceil(page_info['data_total'] / page_info['page_size'])
+        
+        if total_pages:
+            responses = await self.fetch_pages(url, headers, range(2, total_pages + 1))
+            for response in responses:
+                all_packages.extend(response.get('data', {}).get('accepted', []))
+        else:
+            # Sem informação de paginação: busca janelas de páginas em paralelo
+            # até encontrar uma página incompleta, descartando as seguintes.
+            # Página cheia tem o page_size informado; sem ele, o pedido, ou o piso
+            # de 40 quando a primeira página veio exatamente com ele (página limitada)
+            page_len = page_info.get('page_size') or (
+                self.min_page_size if len(packages) == self.min_page_size else self.page_size
+            )
+            next_page = 2
+            while len(packages) >= page_len:
+                window = range(next_page, next_page + self.page_window)
+                next_page += self.page_window
+                for response in await self.fetch_pages(url, headers, window):
+                    packages = response.get('data', {}).get('accepted', [])
+                    all_packages.extend(packages)
+                    if len(packages) < page_len:
+                        break
         
-        logger.info(f'📦 Total de pacotes encontrados: {len(all_packages)}')
+        logger.info('📦 Total de pacotes encontrados: %s', len(all_packages))
         return all_packages
     
-    async def get_detailed_packages(self, packages: List[Dict], url: str, headers: Dict) -> List[Dict]:
-        """Busca detalhes dos pacotes em lotes."""
+    async def iter_detailed_packages(self, packages: List[Dict], url: str, headers: Dict) -> AsyncIterator[Dict]:
+        """
+        Busca detalhes dos pacotes em lotes, entregando os pacotes de cada lote assim que ele chega.
+        
+        Só uma janela de lotes fica agendada à frente do consumidor, e cada lote é
+        descartado depois de entregue: a memória fica em O(janela × lote), não O(total).
+        """
         if not packages:
-            return []
+            return
             
         logger.info('🔍 Buscando detalhes dos pacotes...')
-        detailed_packages = []
         batch_size = 40
+        total_batches = math.ceil(len(packages) / batch_size)
+        
+        # Janela do tamanho do limite máximo de concorrência da API
+        window = max(1, int(self.get_controller(url).maximum))
         
-        # Divide em lotes
-        for i in range(0, len(packages), batch_size):
-            batch = packages[i:i + batch_size]
-            logger.info(f'📦 Processando lote {i//batch_size + 1} de {(len(packages)-1)//batch_size + 1}')
+        # Divide em lotes, gerados sob demanda
+        batches = enumerate(packages[i:i + batch_size] for i in range(0, len(packages), batch_size))
+        
+        async def fetch_batch(index: int, batch: List[Dict]) -> List[Dict]:
+            logger.debug('📦 Processando lote %s de %s', index + 1, total_batches)
             
             track_data = [
                 {"number": pkg["number"], "carrier": pkg["carrier"]}
                 for pkg in batch
             ]
             
-            response = self.make_request('POST', url, json=track_data, headers=headers)
+            response = await self.make_cached_request(url, track_data, headers, self.detail_cache_ttl)
             
             if response.get('code') != 0:
                 raise ValueError(f'Erro ao buscar detalhes: {response.get("message")}')
             
-            batch_details = response.get('data', {}).get('accepted', [])
-            detailed_packages.extend(batch_details)
+            return response.get('data', {}).get('accepted', [])
         
-        return detailed_packages
-    
-    def check_taxation(self, package: Dict) -> bool:
-        """Verifica se um pacote tem problemas alfandegários."""
+        def schedule() -> None:
+            """Completa a janela de lotes em andamento."""
+            while len(tasks) < window and (item := next(batches, None)) is not None:
+                tasks.append(asyncio.ensure_future(fetch_batch(*item)))
+        
+        # Lotes buscados em paralelo (limitados em make_request) e entregues na ordem original
+        tasks: Deque[asyncio.Future] = deque()
         try:
-            track_info = package.get('track_info', {})
-            if not track_info:
-                logger.debug('Pacote inválido ou sem track_info')
-                return False
-            
-            latest_event = track_info.get('latest_event', {}) or {}
-            latest_status = track_info.get('latest_status', {}) or {}
-            
-            status = (latest_status.get('status') or '').lower()
-            event_description = (latest_event.get('description') or '').lower()
-            tracking_number = package.get('number', 'N/A')
-            
-            logger.debug(f'Verificando pacote: {tracking_number}')
-            logger.debug(f'Status: {status}')
-            logger.debug(f'Último evento: {event_description}')
-            
-            # Verifica status problemáticos
-            if status in ['alert', 'expired', 'undelivered']:
-                logger.debug(f'Status problemático encontrado: {status}')
-                return True
+            schedule()
+            while tasks:
+                # Remove o lote da fila antes de entregá-lo, para que possa ser liberado
+                batch_packages = await tasks.popleft()
+                schedule()
+                for pkg in batch_packages:
+                    yield pkg
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def check_taxation(self, view: PkgView) -> Optional[PkgClassification]:
+        """
+        Verifica se um pacote tem problemas alfandegários e o classifica.
+        
+        A tradução e a classificação ficam guardadas na própria visão, para que
+        format_summary_message não precise repetir o trabalho.
+        
+        Returns:
+            Classificação do pacote ou None se não houver pendência
+        """
+        logger.debug('Verificando pacote: %s', view.number)
+        logger.debug('Status: %s', view.status)
+        
+        # Verifica status problemáticos antes de olhar a descrição do evento
+        if view.status in self.problem_statuses:
+            logger.debug('Status problemático encontrado: %s', view.status)
+        else:
+            # Só aqui a descrição é necessária em minúsculas
+            event_lower = view.event_raw.lower()
+            logger.debug('Último evento: %s', event_lower)
             
             # Verifica palavras-chave na descrição
-            if any(keyword in event_description for keyword in self.customs_keywords):
-                logger.debug(f'Pacote retido na alfândega: {event_description}')
-                return True
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f'Erro ao verificar status do pacote {package.get("number", "N/A")}: {e}')
-            return False
+            if not self._customs_re.search(event_lower):
+                return None
+            logger.debug('Pacote retido na alfândega: %s', event_lower)
+        
+        view.event = self.translate_event(view.event_raw)
+        view.classification = self.classify(view.status, view.event.lower())
+        return view.classification
     
-    def translate_event(self, event: str) -> str:
-        """Traduz o evento para português."""
-        translations = {
-            'Import customs clearance delay': 'Atraso no desembaraço aduaneiro',
-            'Customs duties payment requested': 'Pagamento de taxas alfandegárias solicitado',
-            'Package returning to sender': 'Pacote retornando ao remetente',
-            'Carrier note': 'Nota da transportadora',
-            'Awaiting payment': 'Aguardando pagamento',
-            'Devolução determinada pela autoridade competente': 'Devolução determinada pela autoridade competente',
-            'Import customs retained': 'Retido na alfândega',
-            'Import customs clearance complete': 'Desembaraço aduaneiro concluído',
-            'Pending customs inspection': 'Aguardando inspeção aduaneira',
-            'Customs charges due': 'Taxas alfandegárias pendentes'
-        }
+    def classify(self, status: str, event_lc: str) -> PkgClassification:
+        """Define a seção do resumo a partir do status e do evento traduzido."""
+        # Verifica se o pacote está retornando ao remetente
+        if 'retornando ao remetente' in event_lc:
+            return PkgClassification.RETORNANDO
         
-        # Traduz palavras/frases conhecidas
-        translated = event
-        for eng, pt in translations.items():
-            translated = translated.replace(eng, pt)
+        # Verifica se está retido na alfândega
+        if self._customs_re.search(event_lc):
+            return PkgClassification.TAXA_PENDENTE
         
-        return translated
+        # Verifica alertas
+        if status == 'alert':
+            return PkgClassification.EM_ALERTA
+        
+        # Outros problemas ('alert' já tratado acima: expired, undelivered)
+        if status in self.problem_statuses:
+            return PkgClassification.COM_PROBLEMAS
+        
+        return PkgClassification.OUTROS
+    
+    def translate_event(self, event: str) -> str:
+        """Traduz o evento para português."""
+        # Traduz palavras/frases conhecidas em uma única passada
+        return TRANSLATIONS_RE.sub(lambda match: TRANSLATIONS[match.group(0)], event)
 
-    def format_summary_message(self, packages: List[Dict]) -> str:
+    def format_summary_message(self, packages: List[PkgView]) -> str:
         """Formata a mensagem com o resumo dos pacotes."""
         if not packages:
             return "Nenhum pacote com pendências."
@@ -243,92 +615,76 @@ class CustomsSummary:
         com_problemas = []
         mensagem_taxa = None
         
-        for pkg in packages:
-            if not pkg or not pkg.get('track_info'):
-                continue
+        for view in packages:
+            # Classificação e tradução já calculadas em check_taxation
+            classification = view.classification
             
-            track_info = pkg['track_info']
-            latest_event = track_info.get('latest_event', {}) or {}
-            latest_status = track_info.get('latest_status', {}) or {}
-            tracking_number = pkg.get('number', 'N/A')
-            status = (latest_status.get('status') or '').lower()
-            event = latest_event.get('description', '')
-            
-            # Traduz o evento
-            event = self.translate_event(event)
-            
-            # Verifica se o pacote está retornando ao remetente
-            if 'retornando ao remetente' in event.lower():
-                com_problemas.append(f'*{tracking_number}*: {event}')
-                continue
-            
-            # Verifica se está retido na alfândega
-            if any(keyword in event.lower() for keyword in self.customs_keywords):
-                taxas_pendentes.append(f'*{tracking_number}*')
+            if classification is PkgClassification.TAXA_PENDENTE:
+                taxas_pendentes.append(f'*{view.number}*')
                 if not mensagem_taxa:  # Guarda a primeira mensagem de taxa como padrão
-                    mensagem_taxa = event
-                continue
-            
-            # Verifica alertas
-            if status == 'alert':
-                em_alerta.append(f'*{tracking_number}*: {event}')
-                continue
-            
-            # Outros problemas (expired, undelivered)
-            if status in ['expired', 'undelivered']:
-                com_problemas.append(f'*{tracking_number}*: {event}')
+                    mensagem_taxa = view.event
+            elif classification is PkgClassification.EM_ALERTA:
+                em_alerta.append(f'*{view.number}*: {view.event}')
+            elif classification in (PkgClassification.RETORNANDO, PkgClassification.COM_PROBLEMAS):
+                com_problemas.append(f'*{view.number}*: {view.event}')
         
-        message = "📦 *Resumo de Pacotes*\n"
+        parts = ["📦 *Resumo de Pacotes*\n"]
         
         if taxas_pendentes:
-            message += "\n💰 *Taxas Pendentes:*\n"
-            message += '\n'.join(taxas_pendentes)
+            parts.append("\n💰 *Taxas Pendentes:*\n")
+            parts.append('\n'.join(taxas_pendentes))
             if mensagem_taxa:
-                message += f"\n\n_Status: {mensagem_taxa}_"
+                parts.append(f"\n\n_Status: {mensagem_taxa}_")
         
         if em_alerta:
-            message += "\n\n⚠️ *Em Alerta:*\n"
-            message += '\n'.join(em_alerta)
+            parts.append("\n\n⚠️ *Em Alerta:*\n")
+            parts.append('\n'.join(em_alerta))
         
         if com_problemas:
-            message += "\n\n❌ *Com Problemas:*\n"
-            message += '\n'.join(com_problemas)
+            parts.append("\n\n❌ *Com Problemas:*\n")
+            parts.append('\n'.join(com_problemas))
         
-        return message
+        return ''.join(parts)
+    
+    def get_whatsapp_request(self) -> Tuple[str, Dict, str]:
+        """
+        Monta a URL, os headers e o número de destino do WhatsApp.
+        
+        Returns:
+            Tupla (url, headers, número normalizado)
+        """
+        # Carrega configurações do WhatsApp
+        whatsapp_config = get_whatsapp_config()
+        
+        # Valida configurações
+        missing = [k for k, v in whatsapp_config.items() if not v]
+        if missing:
+            raise ValueError(f"Configurações do WhatsApp faltando: {', '.join(missing)}")
+        
+        # Remove caracteres não numéricos do número
+        clean_number = ''.join(filter(str.isdigit, whatsapp_config['whatsapp_number']))
+        if not clean_number:
+            raise ValueError("Número do WhatsApp inválido")
+        
+        # Adiciona o prefixo 55 se não estiver presente
+        if not clean_number.startswith('55'):
+            clean_number = f'55{clean_number}'
+        
+        # Monta a URL com a connectionKey na query string
+        url = f"{whatsapp_config['api_url']}/message/sendText?connectionKey={whatsapp_config['connection_key']}"
+        
+        # Headers da requisição
+        headers = {
+            'Authorization': f"Bearer {whatsapp_config['token']}",
+            'Content-Type': 'application/json'
+        }
+        
+        return url, headers, clean_number
     
     async def send_whatsapp_message(self, message: str) -> None:
         """Envia mensagem via WhatsApp."""
         try:
-            # Carrega configurações do WhatsApp
-            whatsapp_config = {
-                'api_url': os.getenv('WAPI_URL'),
-                'token': os.getenv('WAPI_TOKEN'),
-                'connection_key': os.getenv('WAPI_CONNECTION_KEY'),
-                'whatsapp_number': os.getenv('TECHNICAL_DEPT_NUMBER')
-            }
-            
-            # Valida configurações
-            missing = [k for k, v in whatsapp_config.items() if not v]
-            if missing:
-                raise ValueError(f"Configurações do WhatsApp faltando: {', '.join(missing)}")
-            
-            # Remove caracteres não numéricos do número
-            clean_number = ''.join(filter(str.isdigit, whatsapp_config['whatsapp_number']))
-            if not clean_number:
-                raise ValueError("Número do WhatsApp inválido")
-            
-            # Adiciona o prefixo 55 se não estiver presente
-            if not clean_number.startswith('55'):
-                clean_number = f'55{clean_number}'
-            
-            # Monta a URL com a connectionKey na query string
-            url = f"{whatsapp_config['api_url']}/message/sendText?connectionKey={whatsapp_config['connection_key']}"
-            
-            # Headers da requisição
-            headers = {
-                'Authorization': f"Bearer {whatsapp_config['token']}",
-                'Content-Type': 'application/json'
-            }
+            url, headers, clean_number = self.get_whatsapp_request()
             
             # Dados da mensagem seguindo o formato do cURL
             data = {
@@ -337,10 +693,10 @@ class CustomsSummary:
                 'delayMessage': '1000'
             }
             
-            logger.info(f'Enviando mensagem para {clean_number}...')
+            logger.info('Enviando mensagem para %s...', clean_number)
             
-            # Faz a requisição
-            response = self.make_request('POST', url, json=data, headers=headers)
+            # Faz a requisição (envio não é idempotente: sem retry para não duplicar a mensagem)
+            response = await self.make_request('POST', url, max_retries=1, json=data, headers=headers)
             
             # Verifica se a mensagem foi enviada com sucesso
             if response and response.get('error'):
@@ -365,6 +721,9 @@ class CustomsSummary:
             else:
                 logger.info('ℹ️ Nenhum pacote com pendência alfandegária encontrado.')
             
+            if self.get_redis() is not None:
+                logger.info('🗄️ Cache de respostas: %s hits, %s misses', self.cache_hits, self.cache_misses)
+            
             return {'success': True, 'packages_count': len(packages)}
             
         except Exception as e:
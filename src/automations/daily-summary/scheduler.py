@@ -1,35 +1,60 @@
 import os
 import asyncio
-from datetime import datetime
-import pytz
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+import functools
+import signal
+from typing import Optional
+import aiohttp
 from dotenv import load_dotenv
 from customs_summary import CustomsSummary
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Sessão HTTP compartilhada entre as execuções (criada em main, dentro do loop)
+_session: Optional[aiohttp.ClientSession] = None
+
+@functools.lru_cache(maxsize=1)
 def get_config():
-    """Obtém configuração dos dados de ambiente."""
+    """Obtém configuração dos dados de ambiente (lida uma única vez por processo)."""
     return {
         'endpoint': os.getenv('TRACK17_API_URL'),
         'api_key': os.getenv('TRACK17_API_KEY'),
-        'whatsapp_number': os.getenv('WHATSAPP_NUMBER') or os.getenv('TECHNICAL_DEPT_NUMBER')
+        'whatsapp_number': os.getenv('WHATSAPP_NUMBER') or os.getenv('TECHNICAL_DEPT_NUMBER'),
+        'cache_enabled': os.getenv('SUMMARY_CACHE_ENABLED'),
+        'redis_host': os.getenv('REDIS_HOST'),
+        'redis_port': os.getenv('REDIS_PORT'),
+        'redis_password': os.getenv('REDIS_PASSWORD'),
+        'list_cache_ttl': os.getenv('SUMMARY_LIST_CACHE_TTL'),
+        'detail_cache_ttl': os.getenv('SUMMARY_DETAIL_CACHE_TTL')
     }
 
 async def generate_summary():
     """Função que será executada pelo agendador."""
     try:
         config = get_config()
-        summary = CustomsSummary(config)
-        await summary.generate_daily_summary()
+        summary = CustomsSummary(config, session=_session)
+        try:
+            await summary.generate_daily_summary()
+        finally:
+            await summary.close()
     except Exception as e:
         print(f"Erro ao gerar resumo: {e}")
         raise
 
-def main():
+async def main():
     """Função principal que configura e inicia o agendador."""
+    global _session
+    
+    # Importados aqui: só o agendador precisa deles
+    import pytz
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    
+    # Um único pool de conexões (e cache de DNS) durante toda a vida do agendador
+    _session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, enable_cleanup_closed=True)
+    )
+    
     # Configura o scheduler
     scheduler = AsyncIOScheduler()
     
@@ -41,20 +66,26 @@ def main():
             minute=0,
             timezone=pytz.timezone('America/Sao_Paulo')
         ),
+        id='daily_summary',
         name='daily_summary'
     )
     
-    try:
-        print("Iniciando agendador...")
-        scheduler.start()
-        print(f"Próxima execução: {scheduler.get_job('daily_summary').next_run_time}")
-        
-        # Mantém o programa rodando
-        asyncio.get_event_loop().run_forever()
-        
-    except (KeyboardInterrupt, SystemExit):
-        print("Parando agendador...")
-        scheduler.shutdown()
+    # Encerra ao receber SIGINT/SIGTERM, sem acordar o loop periodicamente
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    print("Iniciando agendador...")
+    scheduler.start()
+    print(f"Próxima execução: {scheduler.get_job('daily_summary').next_run_time}")
+    
+    # Mantém o programa rodando
+    await stop.wait()
+    
+    print("Parando agendador...")
+    scheduler.shutdown()
+    await _session.close()
 
 if __name__ == '__main__':
-    main()
+    asyncio.run(main())
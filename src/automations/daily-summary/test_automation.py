@@ -1,6 +1,7 @@
 import os
 import asyncio
 import logging
+import aiohttp
 from dotenv import load_dotenv
 
 # Configurar logging
@@ -44,7 +45,10 @@ async def run_test():
         # Cria instância e executa teste
         print("\nIniciando teste...")
         summary = CustomsSummary(config)
-        result = await summary.test()
+        try:
+            result = await summary.test()
+        finally:
+            await summary.close()
         
         print("\nResultado:", result)
         print("\n=== TESTE CONCLUÍDO COM SUCESSO ===\n")
@@ -53,9 +57,9 @@ async def run_test():
         print("\n=== ERRO NO TESTE ===\n")
         print(f"Tipo do erro: {type(e).__name__}")
         print(f"Mensagem: {str(e)}")
-        if hasattr(e, 'response'):
-            print(f"Status: {e.response.status_code}")
-            print(f"Resposta: {e.response.text}")
+        if isinstance(e, aiohttp.ClientResponseError):
+            print(f"Status: {e.status}")
+            print(f"Resposta: {e.message}")
         print("\n=========================\n")
         raise
 
@@ -2,34 +2,43 @@ require('dotenv').config({ path: '../../.env' });
 const logger = require('./utils/logger');
 const { RedisStoreSync } = require('./utils/redis-store-sync');
 
+const BATCH_SIZE = 200;
+
 async function inspectRedis() {
+    let redis;
     try {
-        const redis = new RedisStoreSync();
+        redis = new RedisStoreSync();
         
         // Connect to Redis
         await redis.checkConnection();
         logger.info('Connected to Redis successfully');
 
-        // Get all keys
-        const keys = await redis.keys('*');
+        // Get all keys (SCAN, non-blocking for the server)
+        const keys = await redis.getKeys('*');
         logger.info(`Found ${keys.length} keys in Redis`);
 
-        // Inspect each key
-        for (const key of keys) {
+        // Inspect keys in batches: one MGET round-trip per batch
+        for (let i = 0; i < keys.length; i += BATCH_SIZE) {
+            const batch = keys.slice(i, i + BATCH_SIZE);
             try {
-                const value = await redis.get(key);
-                logger.info('-------------------');
-                logger.info(`Key: ${key}`);
-                logger.info(`Value: ${typeof value === 'string' ? value : JSON.stringify(value, null, 2)}`);
+                const values = await redis.mget(batch);
+                batch.forEach((key, index) => {
+                    const value = values[index];
+                    logger.info('-------------------');
+                    logger.info(`Key: ${key}`);
+                    logger.info(`Value: ${typeof value === 'string' ? value : JSON.stringify(value, null, 2)}`);
+                });
             } catch (error) {
-                logger.error(`Error getting value for key ${key}:`, error.message);
+                logger.error(`Error getting values for keys ${batch[0]}..${batch[batch.length - 1]}:`, error.message);
             }
         }
 
     } catch (error) {
         logger.error('Error during Redis inspection:', error);
     } finally {
-        await redis.disconnect();
+        if (redis) {
+            await redis.close();
+        }
     }
 }
 
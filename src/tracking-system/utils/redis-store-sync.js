@@ -425,12 +425,12 @@ class RedisStoreSync {
     async getKeys(pattern) {
         try {
             const keys = [];
-            let cursor = '0';
+            let cursor = 0;
             do {
-                const reply = await this.client.scan(cursor, { match: pattern });
+                const reply = await this.client.scan(cursor, { MATCH: pattern, COUNT: 500 });
                 cursor = reply.cursor;
                 keys.push(...reply.keys);
-            } while (cursor !== '0');
+            } while (String(cursor) !== '0');
             return keys;
         } catch (error) {
             logger.error('[Redis] Erro ao obter chaves:', {
@@ -442,6 +442,25 @@ class RedisStoreSync {
             throw error;
         }
     }
+
+    /**
+     * Obtém os valores de várias chaves em uma única chamada (MGET)
+     * @param {string[]} keys - Chaves a serem buscadas
+     * @returns {Promise<Array<string|null>>} Valores na mesma ordem das chaves
+     */
+    async mget(keys) {
+        try {
+            return await this.client.mGet(keys);
+        } catch (error) {
+            logger.error('[Redis] Erro ao obter valores:', {
+                keys,
+                erro: error.message,
+                stack: error.stack,
+                timestamp: new Date().toISOString()
+            });
+            throw error;
+        }
+    }
 }
 
 module.exports = { RedisStoreSync };